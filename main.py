@@ -1,20 +1,40 @@
 import os
+import asyncio
+import itertools
+import logging
+import zipfile
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from functools import cached_property
 from io import BytesIO
-from fastapi import FastAPI, Response
-from pydantic import BaseModel
+import anyio
+from typing import Annotated
+from fastapi import Body, FastAPI, HTTPException, Response
+from pydantic import BaseModel, ConfigDict
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-from reportlab.platypus import Table, TableStyle, Paragraph
+from reportlab.platypus import Frame, Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
-import threading
+from reportlab.pdfbase.pdfmetrics import stringWidth
 
-app = FastAPI()
-lock = threading.Lock()
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, fine for a single dev server
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 COUNTER_FILE = "counter.txt"
+COUNTER_FLUSH_INTERVAL = 5  # seconds between high-water mark writes
+COUNTER_FLUSH_EVERY = 10  # ...or sooner, once this many numbers are unpersisted
+
+PDF_MEDIA_TYPE = "application/pdf"
+MAX_BATCH = 50  # every PDF and the ZIP are held in memory until the response
 
 # ✅ Input Model
 class SalesContractData(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True, str_strip_whitespace=False)
+
     contract_no: str
     date: str
     company_name: str
@@ -39,30 +59,219 @@ class SalesContractData(BaseModel):
     documents: str
     payment_terms: str
 
+# Make sure the validator is fully built at import, not on the first request
+SalesContractData.model_rebuild()
+
 # ✅ Counter Logic
+# The counter lives in memory; counter.txt is read once at import and the
+# next free number is written back in the background (and on shutdown).
+def _load_counter():
+    try:
+        with open(COUNTER_FILE) as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return 1
+
+_initial = _load_counter()
+_counter = itertools.count(_initial)
+_next_free = None  # next number to persist, None until one has been issued
+_flushed = None
+_flush_wanted = None  # asyncio.Event set by the lifespan while the app runs
+
 def get_next_counter():
-    with lock:
-        if not os.path.exists(COUNTER_FILE):
-            with open(COUNTER_FILE, "w") as f:
-                f.write("1")
-            return 1
-        with open(COUNTER_FILE, "r+") as f:
-            count = int(f.read())
-            f.seek(0)
-            f.write(str(count + 1))
-            f.truncate()
-            return count
+    global _next_free
+    # next() on itertools.count is atomic under the GIL, no lock needed
+    count = next(_counter)
+    _next_free = count + 1
+    # Bound what a crash (SIGKILL, OOM) can lose and later reissue; callers
+    # run on the event loop thread, so setting the asyncio.Event is safe
+    if _flush_wanted is not None and _next_free - (_flushed or _initial) >= COUNTER_FLUSH_EVERY:
+        _flush_wanted.set()
+    return count
+
+def next_pdf_number():
+    # Every worker process keeps its own counter, however many were started,
+    # so the PID keeps numbers from different workers apart
+    return f"{os.getpid()}-{get_next_counter()}"
+
+@contextmanager
+def _counter_file_lock():
+    if fcntl is None:
+        yield
+        return
+    with open(f"{COUNTER_FILE}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def flush_counter():
+    global _flushed
+    issued = _next_free
+    if issued is None or issued == _flushed:
+        return
+    # Workers share counter.txt: only ever move the stored value up, so a
+    # restart resumes above every number any worker has persisted
+    with _counter_file_lock():
+        value = max(issued, _load_counter())
+        tmp_file = f"{COUNTER_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, COUNTER_FILE)
+    _flushed = issued
+
+async def _flush_counter_safely():
+    # File I/O stays off the event loop; a failed write is retried next time
+    try:
+        await anyio.to_thread.run_sync(flush_counter)
+    except OSError:
+        logger.exception("Could not persist %s", COUNTER_FILE)
+
+async def _flush_counter_periodically():
+    while True:
+        try:
+            await asyncio.wait_for(_flush_wanted.wait(), COUNTER_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _flush_wanted.clear()
+        await _flush_counter_safely()
+
+# ✅ App Lifespan
+def _available_cpus():
+    # Honour a cgroup v2 CPU quota (containers) before falling back to affinity
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, int(quota) // int(period))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS / Windows
+        return os.cpu_count() or 1
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Rendering is CPU-bound; it gets its own limiter sized to the CPUs we may
+    # use, leaving the default threadpool to sync dependencies and file I/O
+    app.state.render_limiter = anyio.CapacityLimiter(_available_cpus())
+    global _flush_wanted
+    _flush_wanted = asyncio.Event()
+    counter_flusher = asyncio.create_task(_flush_counter_periodically())
+    yield
+    counter_flusher.cancel()
+    try:
+        await counter_flusher
+    except asyncio.CancelledError:
+        pass
+    _flush_wanted = None
+    await _flush_counter_safely()
+
+app = FastAPI(lifespan=lifespan)
+
+# ✅ Contract Templates
+# Everything that is fixed per contract variant; the layout code is shared
+_TITLE_FONT = ("Helvetica-Bold", 14)
+_ACCEPTED_FONT = ("Helvetica-Bold", 11)
+
+@dataclass(frozen=True)
+class ContractTemplate:
+    title: str
+    filename_prefix: str
+    party_titles: tuple[str, str, str]
+    static_details: tuple[tuple[str, tuple[str, ...]], ...]
+
+    @cached_property
+    def static_layout(self):
+        # The static clauses only move as a block with the dynamic fields above
+        # them, so lay them out once as offsets from where the block starts
+        rows = []
+        offset = 0
+        for label, lines in self.static_details:
+            label_offset = offset
+            line_offsets = []
+            for line in lines:
+                line_offsets.append((offset, line.strip()))
+                offset += 14
+            rows.append((label_offset, f"{label}:", tuple(line_offsets)))
+            offset += 8
+        return tuple(rows), offset
+
+    @cached_property
+    def pdf_filename(self):
+        return f"{self.filename_prefix}_{{}}.pdf".format
+
+    @cached_property
+    def content_disposition(self):
+        return f"attachment; filename={self.filename_prefix}_{{}}.pdf".format
+
+    @cached_property
+    def title_x(self):
+        # Same position drawCentredString would compute, without measuring per request
+        return A4[0] / 2 - 0.5 * stringWidth(self.title, *_TITLE_FONT)
+
+SALES_CONTRACT = ContractTemplate(
+    title="SALES CONTRACT",
+    filename_prefix="Sales_Contract",
+    party_titles=("SELLER", "CONSIGNEE | NOTIFY PARTY 1", "NOTIFY PARTY 2"),
+    static_details=(
+        ("Arbitration", (
+            "In the event of any dispute between the parties arising out of this contract,",
+            "all disputes shall be settled by the way of arbitration through a sole arbitration",
+            "to be appointed by M/S Shraddha Impex. The place of arbitration shall be in Indore, M.P.",
+            "and the laws of India with regards to arbitration shall be applicable to this Arbitration Clause."
+        )),
+        ("Terms & Conditions", (
+            "1) In case of port congestion/skippance of vessel or any other port related disturbances,",
+            "supplier or exporter will not be liable for any claim.",
+            "2) Quality approved at load port by independent surveyors is finaland to be acceptable by both,",
+            " the parties and the seller will not be liable for any claim at destination port."
+        )),
+    ),
+)
+
+TEMPLATES = {
+    "sales": SALES_CONTRACT,
+}
 
 # ✅ PDF Generation
-@app.post("/generate-pdf/")
-async def generate_pdf(data: SalesContractData):
-    pdf_number = get_next_counter()
-    filename = f"Sales_Contract_{pdf_number}.pdf"
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+# Built once at import; getSampleStyleSheet() constructs a fresh stylesheet per call
+_NORMAL_STYLE = getSampleStyleSheet()["Normal"]
+
+# Product table pieces that do not depend on the request
+_TABLE_HEADER = ["Product", "Quantity", "Price (CIF), Colombo", "Amount(CIF)"]
+_COL_WIDTHS = [130, 130, 130, 100]
+_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+])
+
+# Labelled request fields, in drawing order
+_DYNAMIC_DETAILS = (
+    ("Packing:", "packing"),
+    ("Loading Port:", "loading_port"),
+    ("Destination Port:", "destination_port"),
+    ("Shipment:", "shipment"),
+    ("Seller’s Bank:", "sellers_bank"),
+    ("Account No.:", "account_no"),
+    ("Documents:", "documents"),
+    ("Payment Terms:", "payment_terms"),
+)
+
+# Static centred strings are measured once
+_ACCEPTED_X = A4[0] / 2 - 0.5 * stringWidth("Accepted", *_ACCEPTED_FONT)
+
+def render_contract(c: canvas.Canvas, data: SalesContractData, template: ContractTemplate):
     width, height = A4
-    styles = getSampleStyleSheet()
-    normal_style = styles["Normal"]
 
     # Margins
     left_margin = 50
@@ -90,8 +299,8 @@ async def generate_pdf(data: SalesContractData):
 
     # 🔷 Title & Contract Info
     start_y = top_margin - 80
-    c.setFont("Helvetica-Bold", 14)
-    c.drawCentredString(width / 2, start_y, "SALES CONTRACT")
+    c.setFont(*_TITLE_FONT)
+    c.drawString(template.title_x, start_y, template.title)
     c.setFont("Helvetica", 11)
     c.drawString(left_margin, start_y - 20, f"Contract No: {data.contract_no}")
     c.drawRightString(right_margin, start_y - 20, f"Date: {data.date}")
@@ -101,7 +310,6 @@ async def generate_pdf(data: SalesContractData):
     block_width = (width - 100) / 3
     x_positions = [50, 50 + block_width + 10, 50 + 2 * (block_width + 10)]
 
-    titles = ["SELLER",  "CONSIGNEE | NOTIFY PARTY 1",   "NOTIFY PARTY 2"]
     blocks = [
         "\n".join(data.seller),
         "\n".join(data.consignee),
@@ -110,8 +318,7 @@ async def generate_pdf(data: SalesContractData):
 
     c.setFont("Helvetica-Bold", 10)
     for i in range(3):
-        c.drawString(x_positions[i], y, titles[i])
-        c.setFont("Helvetica-Bold", 10)
+        c.drawString(x_positions[i], y, template.party_titles[i])
         text_obj = c.beginText(x_positions[i], y - 14)
         for line in blocks[i].split("\n"):
             text_obj.textLine(line.strip())
@@ -120,99 +327,178 @@ async def generate_pdf(data: SalesContractData):
     y = y - 100  # Space below notify party
 
     # 🔷 Product Table with wrapped text
-    from reportlab.platypus import SimpleDocTemplate, Table
-    from reportlab.platypus import Frame
-
     # Prepare wrapped cells using Paragraph
     table_data = [
-        ["Product", "Quantity", "Price (CIF), Colombo", "Amount(CIF)"],
+        _TABLE_HEADER,
         [
-            Paragraph(data.product_name, normal_style),
-            Paragraph(data.quantity, normal_style),
-            Paragraph(data.price, normal_style),
-            Paragraph(data.amount, normal_style)
+            Paragraph(data.product_name, _NORMAL_STYLE),
+            Paragraph(data.quantity, _NORMAL_STYLE),
+            Paragraph(data.price, _NORMAL_STYLE),
+            Paragraph(data.amount, _NORMAL_STYLE)
         ]
     ]
 
-    table = Table(table_data, colWidths=[130, 130, 130, 100])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-    ]))
+    table = Table(table_data, colWidths=_COL_WIDTHS)
+    table.setStyle(_TABLE_STYLE)
 
     frame = Frame(left_margin, y - 100, width - 2 * left_margin, 100, showBoundary=0)
     frame.addFromList([table], c)
     y = y - 90
 
     # 🔷 Dynamic Fields
-    dynamic_details = [
-        ("Packing", data.packing),
-        ("Loading Port", data.loading_port),
-        ("Destination Port", data.destination_port),
-        ("Shipment", data.shipment),
-        ("Seller’s Bank", data.sellers_bank),
-        ("Account No.", data.account_no),
-        ("Documents", data.documents),
-        ("Payment Terms", data.payment_terms)
-    ]
-    for label, value in dynamic_details:
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(left_margin, y, f"{label}:")
-        c.setFont("Helvetica", 10)
-        for line in str(value).split("\n"):
-            c.drawString(left_margin + 120, y, line.strip())
+    # Lay out (y, label, [(y, line), ...]) rows first, then draw them all in
+    # one text object
+    rows = []
+    for label, field in _DYNAMIC_DETAILS:
+        lines = []
+        label_y = y
+        for line in getattr(data, field).split("\n"):
+            lines.append((y, line.strip()))
             y -= 18
+        rows.append((label_y, label, lines))
         y -= 8
 
     # 🔷 Static Details
-    static_details = [
-        ("Arbitration", [
-            "In the event of any dispute between the parties arising out of this contract,",
-            "all disputes shall be settled by the way of arbitration through a sole arbitration",
-            "to be appointed by M/S Shraddha Impex. The place of arbitration shall be in Indore, M.P.",
-            "and the laws of India with regards to arbitration shall be applicable to this Arbitration Clause."
-        ]),
-        ("Terms & Conditions", [
-            "1) In case of port congestion/skippance of vessel or any other port related disturbances,",
-            "supplier or exporter will not be liable for any claim.",
-            "2) Quality approved at load port by independent surveyors is finaland to be acceptable by both,",
-            " the parties and the seller will not be liable for any claim at destination port."
-        ])
-    ]
-    for label, lines in static_details:
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(left_margin, y, f"{label}:")
-        c.setFont("Helvetica", 10)
-        for line in lines:
-            c.drawString(left_margin + 120, y, line.strip())
-            y -= 14
-        y -= 8
+    static_rows, static_height = template.static_layout
+    for label_offset, label, line_offsets in static_rows:
+        rows.append((y - label_offset, label, [(y - offset, line) for offset, line in line_offsets]))
+    y -= static_height
+
+    # A single BT/ET text object covers every detail row. Each label is
+    # followed by its own value lines so text extraction, copy-paste and
+    # screen readers keep them together.
+    text_obj = c.beginText()
+    for label_y, label, lines in rows:
+        text_obj.setFont("Helvetica-Bold", 10)
+        text_obj.setTextOrigin(left_margin, label_y)
+        text_obj.textOut(label)
+        text_obj.setFont("Helvetica", 10)
+        for line_y, line in lines:
+            text_obj.setTextOrigin(left_margin + 120, line_y)
+            text_obj.textOut(line)
+    c.drawText(text_obj)
 
     # 🔷 Acceptance Block
-    c.setFont("Helvetica-Bold", 11)
-    c.drawCentredString(width / 2, y, "Accepted")
+    c.setFont(*_ACCEPTED_FONT)
+    c.drawString(_ACCEPTED_X, y, "Accepted")
     y -= 20
-    c.setFont("Helvetica", 10)
-    c.drawString(50, y, "For, Seller")
-    c.drawString(230, y, "For, Consignee")
-    c.drawString(400, y, "For, Notify Party")
-    y -= 50
-    c.drawString(50, y, data.seller[0] if data.seller else "")
-    c.drawString(230, y, data.consignee[0] if data.consignee else "")
-    c.drawString(400, y, (data.notify_party[0] if data.notify_party else "TO ORDER"))
+    signatures = [
+        (50, y, "For, Seller"),
+        (230, y, "For, Consignee"),
+        (400, y, "For, Notify Party"),
+        (50, y - 50, data.seller[0] if data.seller else ""),
+        (230, y - 50, data.consignee[0] if data.consignee else ""),
+        (400, y - 50, data.notify_party[0] if data.notify_party else "TO ORDER"),
+    ]
+    text_obj = c.beginText()
+    text_obj.setFont("Helvetica", 10)
+    for x, row_y, text in signatures:
+        text_obj.setTextOrigin(x, row_y)
+        text_obj.textOut(text)
+    c.drawText(text_obj)
 
+def _render_pdf(data: SalesContractData, template: ContractTemplate) -> BytesIO:
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    render_contract(c, data, template)
     # ✅ Save
     c.save()
-    buffer.seek(0)
-    return Response(content=buffer.read(), media_type="application/pdf", headers={
-        "Content-Disposition": f"attachment; filename={filename}"
+    return buffer
+
+async def _render_in_thread(data: SalesContractData, template: ContractTemplate) -> BytesIO:
+    return await anyio.to_thread.run_sync(
+        _render_pdf, data, template, limiter=app.state.render_limiter
+    )
+
+@app.post("/generate-pdf/")
+async def generate_pdf(data: SalesContractData):
+    return await _pdf_response(data, SALES_CONTRACT)
+
+@app.post("/generate-pdf/{variant}")
+async def generate_variant_pdf(variant: str, data: SalesContractData):
+    template = TEMPLATES.get(variant)
+    if template is None:
+        raise HTTPException(status_code=404, detail=f"Unknown contract variant: {variant}")
+    return await _pdf_response(data, template)
+
+async def _render_contract_or_422(data: SalesContractData, template: ContractTemplate, item="Contract"):
+    # paraparser raises ValueError for table-cell markup it cannot parse;
+    # that is bad input, anything else is a server bug and stays a 500
+    try:
+        return await _render_in_thread(data, template)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=f"{item} could not be rendered: {exc}")
+
+async def _pdf_response(data: SalesContractData, template: ContractTemplate):
+    pdf_number = next_pdf_number()
+    buffer = await _render_contract_or_422(data, template)
+    # Response takes the zero-copy memoryview as-is and sets Content-Length;
+    # unlike a sync-iterator StreamingResponse it needs no threadpool hop
+    return Response(content=buffer.getbuffer(), media_type=PDF_MEDIA_TYPE, headers={
+        "Content-Disposition": template.content_disposition(pdf_number),
+    })
+
+# ✅ Batch PDF Generation
+# Numbering -> rendering -> zipping run as a pipeline joined by queues, with
+# one renderer per render-limiter slot
+@app.post("/generate-pdf-batch/")
+async def generate_pdf_batch(
+    items: Annotated[list[SalesContractData], Body(min_length=1, max_length=MAX_BATCH)],
+):
+    template = SALES_CONTRACT
+    workers = min(len(items), app.state.render_limiter.total_tokens)
+    render_q = asyncio.Queue(maxsize=workers)
+    zip_q = asyncio.Queue()
+    zip_buffer = BytesIO()
+    failure = None
+
+    async def feed():
+        for index, data in enumerate(items):
+            await render_q.put((index, next_pdf_number(), data))
+        for _ in range(workers):
+            await render_q.put(None)
+
+    async def render():
+        nonlocal failure
+        while (job := await render_q.get()) is not None:
+            index, pdf_number, data = job
+            try:
+                buffer = await _render_contract_or_422(data, template, f"Contract at index {index}")
+            except HTTPException as exc:
+                # Stop the whole pipeline and report the offending item
+                failure = exc
+                tg.cancel_scope.cancel()
+                return
+            await zip_q.put((template.pdf_filename(pdf_number), buffer))
+        await zip_q.put(None)
+
+    async def pack():
+        finished = 0
+        # The PDFs are already flate-compressed, so store them as-is
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as archive:
+            while finished < workers:
+                entry = await zip_q.get()
+                if entry is None:
+                    finished += 1
+                    continue
+                name, buffer = entry
+                archive.writestr(name, buffer.getbuffer())
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(feed)
+        for _ in range(workers):
+            tg.start_soon(render)
+        tg.start_soon(pack)
+
+    if failure is not None:
+        raise failure
+
+    return Response(content=zip_buffer.getbuffer(), media_type="application/zip", headers={
+        "Content-Disposition": f"attachment; filename={template.filename_prefix}_batch.zip",
     })
 
+# The return annotation lets FastAPI serialize straight to JSON bytes through
+# pydantic-core, and async def keeps health checks off the threadpool
 @app.get("/")
-def home():
+async def home() -> dict[str, str]:
     return {"message": "Your Render App is Working!"}